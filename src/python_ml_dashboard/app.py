@@ -5,7 +5,6 @@ import numpy as np
 import os
 import sys
 import json
-from datetime import datetime, timedelta, time
 import pytz # For timezone handling
 
 # Add the parent directory to the Python path to import rust_data_collector
@@ -22,13 +21,18 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-st.write("--- DEBUG INFO ---")
-st.write(f"DEBUG: sys.path at start of app.py: {sys.path}")
+# Debug output is opt-in, otherwise it is re-sent to the frontend on every rerun
+APP_DEBUG = bool(os.getenv("APP_DEBUG"))
+
+if APP_DEBUG:
+    st.write("--- DEBUG INFO ---")
+    st.write(f"DEBUG: sys.path at start of app.py: {sys.path}")
 
 # Import Rust data collector
 try:
     import rust_data_collector
-    st.write(f"DEBUG: Successfully imported rust_data_collector. Module path: {rust_data_collector.__file__}")
+    if APP_DEBUG:
+        st.write(f"DEBUG: Successfully imported rust_data_collector. Module path: {rust_data_collector.__file__}")
 except ImportError:
     st.error("Rust data collector module not found. Please ensure it's built and accessible.")
     st.info("Run `cargo build --release` in `src/rust_data_collector` and ensure the generated library is in your system's PATH or PYTHONPATH (or copied to site-packages).")
@@ -36,21 +40,30 @@ except ImportError:
 
 # Import local Python modules
 from python_ml_dashboard.config import (
-    LATITUDE, LONGITUDE, DATA_DIR, WORKING_HOURS_START, WORKING_HOURS_END,
+    LATITUDE, LONGITUDE, DATA_DIR, SMARD_PATH, WEATHER_PATH, WORKING_HOURS_START, WORKING_HOURS_END,
     EV_CHARGE_TARGET_SOC, EV_BATTERY_CAPACITY_KWH, EV_CHARGING_POWER_KW,
     DISHWASHER_POWER_KW, WASHING_MACHINE_POWER_KW
 )
 from python_ml_dashboard.data_processor import get_combined_data, GERMAN_TIMEZONE
-from python_ml_dashboard.ml_model import make_smart_decisions, predict_future_energy_profile
+from python_ml_dashboard.ml_model import UserPrefs, make_smart_decisions, predict_future_energy_profile, decode_reasons
+
+# --- Cached Pipeline Stages ---
+# Streamlit reruns this whole script on every widget interaction. Cache the data
+# pipeline so it is only recomputed when a data file or a preference changes.
+@st.cache_data(show_spinner=False)
+def load_combined_data(data_dir: str, smard_mtime: float, weather_mtime: float) -> pd.DataFrame:
+    """Loads the combined data; the file mtimes only serve as cache keys."""
+    return get_combined_data(data_dir)
+
+@st.cache_data(show_spinner=False)
+def compute_recommendations(
+    _combined_df: pd.DataFrame, smard_mtime: float, weather_mtime: float, user_prefs: UserPrefs
+) -> pd.DataFrame:
+    """Runs forecasting and decision making; keyed on the file mtimes instead of hashing the frame."""
+    df_forecast = predict_future_energy_profile(_combined_df) # Currently returns input df
+    return make_smart_decisions(df_forecast, user_prefs)
 
 # --- Streamlit UI Setup ---
-st.set_page_config(
-    page_title="Smart Home Energy Optimizer",
-    page_icon="⚡",
-    layout="wide", # Use wide layout for more space
-    initial_sidebar_state="expanded"
-)
-
 # Custom CSS for a classic and cool look (as defined in .streamlit/config.toml)
 # This just provides some additional styling.
 st.markdown(
@@ -80,15 +93,15 @@ ev_charge_power = st.sidebar.slider("EV Charging Power (kW)", 3.0, 22.0, EV_CHAR
 dishwasher_power = st.sidebar.slider("Dishwasher Power (kW)", 0.5, 3.0, DISHWASHER_POWER_KW, 0.1)
 washing_machine_power = st.sidebar.slider("Washing Machine Power (kW)", 0.5, 3.0, WASHING_MACHINE_POWER_KW, 0.1)
 
-user_prefs = {
-    "WORKING_HOURS_START": working_hours_start_input,
-    "WORKING_HOURS_END": working_hours_end_input,
-    "EV_CHARGING_POWER_KW": ev_charge_power,
-    "DISHWASHER_POWER_KW": dishwasher_power,
-    "WASHING_MACHINE_POWER_KW": washing_machine_power,
-    "EV_CHARGE_TARGET_SOC": EV_CHARGE_TARGET_SOC,
-    "EV_BATTERY_CAPACITY_KWH": EV_BATTERY_CAPACITY_KWH,
-}
+user_prefs = UserPrefs(
+    working_hours_start=working_hours_start_input,
+    working_hours_end=working_hours_end_input,
+    ev_charging_power_kw=ev_charge_power,
+    dishwasher_power_kw=dishwasher_power,
+    washing_machine_power_kw=washing_machine_power,
+    ev_charge_target_soc=EV_CHARGE_TARGET_SOC,
+    ev_battery_capacity_kwh=EV_BATTERY_CAPACITY_KWH,
+)
 
 # Ensure data directory exists before trying to save
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -109,40 +122,40 @@ if st.sidebar.button("Fetch Latest Data (via Rust)"):
 st.header("Hourly Recommendations")
 
 # Check if data files exist before attempting to load
-smard_file_exists = os.path.exists(os.path.join(DATA_DIR, "smard_prices.json"))
-weather_file_exists = os.path.exists(os.path.join(DATA_DIR, "weather_data.json"))
+smard_file_exists = os.path.exists(SMARD_PATH)
+weather_file_exists = os.path.exists(WEATHER_PATH)
 
 if not smard_file_exists or not weather_file_exists:
     st.info("Please click 'Fetch Latest Data' in the sidebar to get started.")
 else:
     # Load and process data
     try:
-        combined_df = get_combined_data(DATA_DIR)
+        smard_mtime = os.path.getmtime(SMARD_PATH)
+        weather_mtime = os.path.getmtime(WEATHER_PATH)
+        combined_df = load_combined_data(DATA_DIR, smard_mtime, weather_mtime)
         st.success(f"Data loaded successfully covering {combined_df.index.min().strftime('%Y-%m-%d %H:%M')} to {combined_df.index.max().strftime('%Y-%m-%d %H:%M')} (Germany/Berlin Time).")
 
         # Perform ML (placeholder) and decision making
-        df_forecast = predict_future_energy_profile(combined_df) # Currently returns input df
-        recommendations_df = make_smart_decisions(df_forecast, user_prefs)
+        recommendations_df = compute_recommendations(
+            combined_df, smard_mtime, weather_mtime, user_prefs
+        )
 
         st.subheader("Optimal Usage Schedule")
 
-        # Get current hour recommendation based on German timezone
-        now_utc = datetime.utcnow().replace(second=0, microsecond=0)
-        now_local = now_utc.astimezone(GERMAN_TIMEZONE)
-        
-        # Ensure the index is timezone-aware for accurate lookup
-        recommendations_df.index = recommendations_df.index.tz_localize(None).tz_localize(GERMAN_TIMEZONE)
-        
-        # Filter for the current hour
-        current_hour_rec = recommendations_df[
-            (recommendations_df.index.hour == now_local.hour) &
-            (recommendations_df.index.day == now_local.day) &
-            (recommendations_df.index.month == now_local.month) &
-            (recommendations_df.index.year == now_local.year)
-        ]
-
-        if not current_hour_rec.empty:
-            current_rec = current_hour_rec.iloc[0]
+        # Get current hour recommendation based on German timezone.
+        # Floor in UTC so the hour stays unambiguous across DST changes.
+        now_local = pd.Timestamp.now(tz='UTC').floor('h').tz_convert(GERMAN_TIMEZONE)
+
+        # The index is already Berlin-localized by get_combined_data and sorted,
+        # so a binary search finds the current hour without scanning it
+        current_pos = recommendations_df.index.searchsorted(now_local)
+        has_current_hour = (
+            current_pos < len(recommendations_df)
+            and recommendations_df.index[current_pos] == now_local
+        )
+
+        if has_current_hour:
+            current_rec = recommendations_df.iloc[current_pos]
             st.markdown(f"### Current Hour Recommendation ({now_local.strftime('%Y-%m-%d %H:%M')}):")
             col1, col2, col3, col4 = st.columns(4)
             with col1:
@@ -166,8 +179,9 @@ else:
                 st.success("💰 Sell excess power to the grid!")
             if not (current_rec['charge_ev'] or current_rec['run_dishwasher'] or current_rec['run_washing_machine'] or current_rec['sell_to_grid']):
                 st.info("😴 No specific actions recommended for this hour. Good time for low consumption.")
-            if current_rec['reason']:
-                st.caption(f"Reason: {current_rec['reason']}")
+            current_reason = decode_reasons(recommendations_df.iloc[[current_pos]]).iloc[0]
+            if current_reason:
+                st.caption(f"Reason: {current_reason}")
 
         else:
             st.warning("No recommendation available for the current hour. Data might be outdated or missing. Try fetching latest data.")
@@ -176,7 +190,7 @@ else:
         st.subheader("Upcoming Hours' Recommendations")
 
         # Display upcoming 24 hours (starting from next hour)
-        upcoming_start_time = now_local.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        upcoming_start_time = now_local + pd.Timedelta(hours=1)
         upcoming_df = recommendations_df[recommendations_df.index >= upcoming_start_time].head(24)
 
         if not upcoming_df.empty:
@@ -187,9 +201,8 @@ else:
                 'charge_ev',
                 'run_dishwasher',
                 'run_washing_machine',
-                'sell_to_grid',
-                'reason'
-            ]].copy()
+                'sell_to_grid'
+            ]].assign(reason=decode_reasons(upcoming_df)) # Only the displayed rows get their reasons formatted
             display_df.index = display_df.index.strftime('%Y-%m-%d %H:%M')
             display_df.rename(columns={
                 'price_eur_kwh': 'Price (€/kWh)',
@@ -202,12 +215,15 @@ else:
                 'reason': 'Reason'
             }, inplace=True)
 
-            def style_boolean(val):
-                if val:
-                    return 'background-color: #2EC4B6; color: white; font-weight: bold; border-radius: 3px; padding: 2px 5px;'
-                return ''
+            def style_boolean(col):
+                # Styles a whole column at once instead of calling back per cell
+                return np.where(
+                    col.to_numpy(dtype=bool),
+                    'background-color: #2EC4B6; color: white; font-weight: bold; border-radius: 3px; padding: 2px 5px;',
+                    ''
+                )
 
-            st.dataframe(display_df.style.applymap(style_boolean, subset=['Charge EV', 'Run Dishwasher', 'Run Washing Machine', 'Sell to Grid']),
+            st.dataframe(display_df.style.apply(style_boolean, subset=['Charge EV', 'Run Dishwasher', 'Run Washing Machine', 'Sell to Grid']),
                          use_container_width=True)
 
             st.markdown("---")
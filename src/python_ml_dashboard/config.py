@@ -25,7 +25,9 @@ WASHING_MACHINE_POWER_KW = 2.5 # Example average power
 
 # --- Data Paths ---
 # Use absolute path to ensure consistency regardless of where script is run
-DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data')
+DATA_DIR = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data'))
+SMARD_PATH = os.path.join(DATA_DIR, "smard_prices.json")
+WEATHER_PATH = os.path.join(DATA_DIR, "weather_data.json")
 
 # --- SMARD API Endpoints (Public data) ---
 SMARD_BASE_URL = "https://www.smard.de/app/chart_data"
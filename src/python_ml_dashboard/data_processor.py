@@ -1,53 +1,90 @@
 # src/python_ml_dashboard/data_processor.py
 import pandas as pd
+import numpy as np
 import json
 import os
 from datetime import datetime, timedelta
 import pytz # For timezone handling
 
+try:
+    import orjson # Faster JSON parser, used when installed
+except ImportError:
+    orjson = None
+
 GERMAN_TIMEZONE = pytz.timezone('Europe/Berlin')
 
+# Day period factor for each hour of the day, used by the solar potential heuristic.
+# Peak at noon, zero at 0/24 (simple parabola)
+_DAY_FACTOR = np.maximum(0.0, 1.0 - 0.05 * (np.arange(24, dtype=np.float64) - 12.0)**2)
+
+def _read_json(filepath: str):
+    """Reads a JSON file, using orjson if available and the stdlib parser otherwise."""
+    if orjson is not None:
+        with open(filepath, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
 def load_smard_prices(filepath: str) -> pd.DataFrame:
     """Loads and processes SMARD electricity price data."""
-    with open(filepath, 'r') as f:
-        data = json.load(f)
-
-    df = pd.DataFrame(data['data'])
-    # SMARD timestamps are in milliseconds, convert to seconds
-    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
-    df['timestamp'] = df['timestamp'].dt.tz_convert(GERMAN_TIMEZONE)
-    df.rename(columns={'value': 'price_eur_mwh'}, inplace=True)
-    df.set_index('timestamp', inplace=True)
-    df = df.resample('H').mean() # Ensure hourly and fill gaps if any, simple mean
-    df['price_eur_kwh'] = df['price_eur_mwh'] / 1000 # Convert EUR/MWh to EUR/kWh
-    return df[['price_eur_kwh']]
+    data = _read_json(filepath)
+
+    # Pull timestamps and prices straight into typed arrays so the datetime
+    # conversion runs on a plain int64 array instead of an object column
+    points = data['data']
+    timestamp_ms = np.fromiter((p['timestamp'] for p in points), dtype=np.int64, count=len(points))
+    price_eur_mwh = np.fromiter((p['value'] for p in points), dtype=np.float64, count=len(points))
+
+    # SMARD timestamps are in milliseconds
+    timestamps = pd.to_datetime(timestamp_ms, unit='ms', utc=True).tz_convert(GERMAN_TIMEZONE)
+    df = pd.DataFrame(
+        {'price_eur_kwh': price_eur_mwh / 1000}, # Convert EUR/MWh to EUR/kWh
+        index=pd.Index(timestamps, name='timestamp'),
+    )
+    # SMARD already delivers hourly values, so just enforce the hourly grid
+    # (gaps become NaN) rather than paying for a full resample-and-mean pass
+    df = df.sort_index()
+    df = df[~df.index.duplicated()]
+    return df.asfreq('h')
 
 def load_weather_data(filepath: str) -> pd.DataFrame:
     """Loads and processes OpenWeatherMap weather forecast data."""
-    with open(filepath, 'r') as f:
-        data = json.load(f)
+    data = _read_json(filepath)
 
-    # Process hourly forecast
-    hourly_df = pd.DataFrame(data['hourly'])
-    hourly_df['timestamp'] = pd.to_datetime(hourly_df['dt'], unit='s', utc=True)
-    hourly_df['timestamp'] = hourly_df['timestamp'].dt.tz_convert(GERMAN_TIMEZONE)
-    hourly_df.set_index('timestamp', inplace=True)
+    # Process hourly forecast, extracting only the fields we use straight into arrays
+    # instead of building a DataFrame out of every OpenWeatherMap field
+    hourly = data['hourly']
+    n = len(hourly)
+    dt = np.empty(n, dtype=np.int64)
+    temperature_c = np.empty(n, dtype=np.float64)
+    humidity = np.empty(n, dtype=np.int16)
+    cloudiness_percent = np.empty(n, dtype=np.int16)
+    pop = np.empty(n, dtype=np.float64) # Probability of precipitation
+    for i, h in enumerate(hourly):
+        dt[i] = h['dt']
+        temperature_c[i] = h['temp']
+        humidity[i] = h['humidity']
+        cloudiness_percent[i] = h['clouds']['all']
+        pop[i] = h['pop']
 
-    # Extract relevant weather features
-    hourly_df['temperature_c'] = hourly_df['temp']
-    hourly_df['humidity'] = hourly_df['humidity']
-    hourly_df['cloudiness_percent'] = hourly_df['clouds'].apply(lambda x: x['all'])
-    hourly_df['pop'] = hourly_df['pop'] # Probability of precipitation
+    timestamps = pd.to_datetime(dt, unit='s', utc=True).tz_convert(GERMAN_TIMEZONE)
 
     # Create a simplified 'solar_potential' heuristic (can be replaced by real data)
-    hourly_df['hour_of_day'] = hourly_df.index.hour
-    hourly_df['day_period_factor'] = hourly_df['hour_of_day'].apply(
-        lambda h: max(0, -0.05 * (h - 12)**2 + 1.0) # Peak at noon, zero at 0/24 (simple parabola)
-    )
-    hourly_df['solar_potential'] = (100 - hourly_df['cloudiness_percent']) / 100 * hourly_df['day_period_factor']
-    hourly_df['solar_potential'] = hourly_df['solar_potential'].clip(0, 1) # Ensure 0-1 range
+    day_period_factor = _DAY_FACTOR[timestamps.hour.to_numpy()]
+    solar_potential = (100 - cloudiness_percent) / 100 * day_period_factor
+    solar_potential = np.clip(solar_potential, 0, 1) # Ensure 0-1 range
 
-    return hourly_df[['temperature_c', 'humidity', 'cloudiness_percent', 'pop', 'solar_potential']]
+    # Build the frame in one go rather than adding derived columns one by one
+    return pd.DataFrame(
+        {
+            'temperature_c': temperature_c,
+            'humidity': humidity,
+            'cloudiness_percent': cloudiness_percent,
+            'pop': pop,
+            'solar_potential': solar_potential,
+        },
+        index=pd.Index(timestamps, name='timestamp'),
+    )
 
 def get_combined_data(data_dir: str) -> pd.DataFrame:
     """Combines electricity prices and weather data."""
@@ -58,13 +95,7 @@ def get_combined_data(data_dir: str) -> pd.DataFrame:
     weather_df = load_weather_data(weather_file)
 
     # Combine dataframes on their time index
-    combined_df = pd.merge(
-        prices_df,
-        weather_df,
-        left_index=True,
-        right_index=True,
-        how='inner' # Only keep hours where both data sources exist
-    )
+    combined_df = prices_df.join(weather_df, how='inner') # Only keep hours where both data sources exist
     return combined_df
 
 if __name__ == "__main__":
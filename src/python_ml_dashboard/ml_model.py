@@ -1,20 +1,52 @@
 # src/python_ml_dashboard/ml_model.py
 import pandas as pd
-from datetime import datetime, time
+from datetime import datetime
 import numpy as np
-from typing import Dict, Any
+import warnings
+from dataclasses import dataclass
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError: # Numba is optional, the decision rules then run as plain Python
+    NUMBA_AVAILABLE = False
+    prange = range
+
+# Below this many hours the thread start-up cost outweighs running the kernel in parallel
+PARALLEL_MIN_HOURS = 2048
+
+# Bit flags making up each hour's reason code
+R_DW_SOLAR = 1 # Dishwasher runs on excess solar
+R_WM_SOLAR = 2 # Washing machine runs on excess solar
+R_EV_SOLAR = 4 # EV charges on excess solar
+R_SELL = 8 # Remaining excess solar is sold to the grid
+R_EV_GRID = 16 # EV charges at a low grid price
+R_WM_GRID = 32 # Washing machine runs at a very low grid price
+R_DW_GRID = 64 # Dishwasher runs at a very low grid price
+R_EXCESS_UNSOLD = 128 # Excess solar left over, but the selling price is not optimal
+
+@dataclass(frozen=True)
+class UserPrefs:
+    """User preferences driving the decision rules. Frozen, so it can be used as a cache key."""
+    working_hours_start: int # Hour of day (24h)
+    working_hours_end: int # Hour of day (24h), exclusive
+    ev_charging_power_kw: float
+    dishwasher_power_kw: float
+    washing_machine_power_kw: float
+    ev_charge_target_soc: float # Not used in current basic model, for future
+    ev_battery_capacity_kwh: float # Not used in current basic model, for future
 
 def predict_future_energy_profile(df: pd.DataFrame) -> pd.DataFrame:
     """
     Placeholder: In a real scenario, this would forecast future electricity
     prices, solar generation, and perhaps household demand.
-    For now, it simply returns the fetched data.
+    For now, it simply returns the fetched data (the same object, not a copy).
     """
-    return df.copy()
+    return df
 
 def make_smart_decisions(
     df_forecast: pd.DataFrame,
-    user_prefs: Dict[str, Any],
+    user_prefs: UserPrefs,
     solar_panel_output_kw_peak: float = 5.0, # Example: 5 kWp solar system capacity
     house_base_consumption_kw: float = 0.3 # Example: constant base load of the house
 ) -> pd.DataFrame:
@@ -22,101 +54,192 @@ def make_smart_decisions(
     Makes smart recommendations based on forecasted data and user preferences.
     This is currently rule-based.
     """
-    recommendations_df = df_forecast.copy()
+    # A shallow copy is enough: columns are only added, never modified in place
+    recommendations_df = df_forecast.copy(deep=False)
 
     # Calculate estimated solar generation (simple heuristic)
-    recommendations_df['estimated_solar_generation_kw'] = recommendations_df['solar_potential'] * solar_panel_output_kw_peak
-
-    # Calculate net consumption/production *before* major appliances/EV
-    recommendations_df['net_grid_demand_kw'] = (
-        house_base_consumption_kw
-        - recommendations_df['estimated_solar_generation_kw']
+    estimated_solar_generation_kw = recommendations_df['solar_potential'].to_numpy(dtype=np.float64) * solar_panel_output_kw_peak
+
+    # Calculate net consumption/production *before* major appliances/EV.
+    # Kept in float64: decode_reasons() recovers the solar surplus from it, and
+    # float32 would round surpluses sitting on a .xx5 value the other way.
+    recommendations_df['net_grid_demand_kw'] = house_base_consumption_kw - estimated_solar_generation_kw
+
+    # The estimated solar column is only displayed, so float32 is enough to store it.
+    # Decisions below still use the float64 values, since cloudiness is an integer
+    # percentage and exact ties with the thresholds would otherwise flip.
+    recommendations_df['estimated_solar_generation_kw'] = estimated_solar_generation_kw.astype(np.float32)
+
+    # Get user preferences as fixed scalar types, so the compiled kernel sees the
+    # same signature on every call (an int passed for a power would force a recompile)
+    working_hours_start = int(user_prefs.working_hours_start)
+    working_hours_end = int(user_prefs.working_hours_end)
+    ev_charge_power_kw = float(user_prefs.ev_charging_power_kw)
+    dishwasher_power_kw = float(user_prefs.dishwasher_power_kw)
+    washing_machine_power_kw = float(user_prefs.washing_machine_power_kw)
+    house_base_consumption_kw = float(house_base_consumption_kw)
+
+    price = recommendations_df['price_eur_kwh'].to_numpy(dtype=np.float64)
+
+    # Thresholds are the same for every hour, so compute them once
+    # Arbitrary threshold for selling price (e.g., above 10% of max price)
+    sell_price_threshold = float(recommendations_df['price_eur_kwh'].max() * 0.1)
+    # Identify cheapest 25% of hours for grid power, and an even cheaper 15% for appliances.
+    # Both come from one pass over the raw array; nanquantile skips missing hours like Series.quantile.
+    if price.size:
+        with warnings.catch_warnings():
+            # An all-NaN price column gives NaN thresholds, silently like Series.quantile
+            warnings.simplefilter('ignore', RuntimeWarning)
+            price_quartile_threshold_appliance, price_quartile_threshold_ev = (
+                float(q) for q in np.nanquantile(price, [0.15, 0.25])
+            )
+    else:
+        # No overlapping price and weather hours, nanquantile would return a single scalar NaN
+        price_quartile_threshold_appliance = price_quartile_threshold_ev = np.nan
+    hours = recommendations_df.index.hour.to_numpy()
+
+    if not NUMBA_AVAILABLE:
+        decide = _decide_rules
+    elif len(price) >= PARALLEL_MIN_HOURS:
+        decide = _decide_kernel_parallel
+    else:
+        decide = _decide_kernel
+    charge_ev, run_dishwasher, run_washing_machine, sell_to_grid, reason_code = decide(
+        price, estimated_solar_generation_kw, hours,
+        working_hours_start, working_hours_end,
+        house_base_consumption_kw, dishwasher_power_kw, washing_machine_power_kw, ev_charge_power_kw,
+        sell_price_threshold, price_quartile_threshold_ev, price_quartile_threshold_appliance,
     )
 
-    # Initialize recommendation columns
-    recommendations_df['charge_ev'] = False
-    recommendations_df['run_dishwasher'] = False
-    recommendations_df['run_washing_machine'] = False
-    recommendations_df['sell_to_grid'] = False
-    recommendations_df['reason'] = ''
-
-    # Get user preferences
-    working_hours_start = time(user_prefs['WORKING_HOURS_START'])
-    working_hours_end = time(user_prefs['WORKING_HOURS_END'])
-    ev_charge_power_kw = user_prefs['EV_CHARGING_POWER_KW']
-    dishwasher_power_kw = user_prefs['DISHWASHER_POWER_KW']
-    washing_machine_power_kw = user_prefs['WASHING_MACHINE_POWER_KW']
-
-    # Make decisions for each hour
-    for index, row in recommendations_df.iterrows():
-        current_time = index.time()
-        current_price = row['price_eur_kwh']
-        solar_available = row['estimated_solar_generation_kw']
-        is_working_hours = working_hours_start <= current_time < working_hours_end
-
-        hour_reasons = []
-        actions_taken = {} # Track actions for current hour to avoid double-claiming solar
+    recommendations_df['charge_ev'] = charge_ev
+    recommendations_df['run_dishwasher'] = run_dishwasher
+    recommendations_df['run_washing_machine'] = run_washing_machine
+    recommendations_df['sell_to_grid'] = sell_to_grid
+    # Reasons are kept as bit flags, see decode_reasons() for the readable text
+    recommendations_df['reason_code'] = reason_code
+    # The kW figures in the reason text depend on the preferences the decisions were made with,
+    # so they travel with the frame (attrs survive row selection and Streamlit's cache pickling)
+    recommendations_df.attrs['user_prefs'] = user_prefs
 
-        # --- Priority 1: Maximize Self-Consumption & Smart Selling ---
-        # If we have excess solar
-        if solar_available > 0.05: # Small threshold to ignore tiny amounts
-            # If solar generation exceeds base consumption, consider selling or using for high-load items
-            net_after_base = solar_available - house_base_consumption_kw
-
-            # Consider running appliances or EV first with excess solar
-            if net_after_base > dishwasher_power_kw * 0.7 and not actions_taken.get('dishwasher'):
-                recommendations_df.loc[index, 'run_dishwasher'] = True
-                hour_reasons.append(f"Running Dishwasher with excess solar ({net_after_base:.2f}kW available).")
-                actions_taken['dishwasher'] = True
-                net_after_base -= dishwasher_power_kw
-
-            if net_after_base > washing_machine_power_kw * 0.7 and not actions_taken.get('washing_machine'):
-                recommendations_df.loc[index, 'run_washing_machine'] = True
-                hour_reasons.append(f"Running Washing Machine with excess solar ({net_after_base:.2f}kW available).")
-                actions_taken['washing_machine'] = True
-                net_after_base -= washing_machine_power_kw
-
-            if not is_working_hours and net_after_base > ev_charge_power_kw * 0.5 and not actions_taken.get('ev'):
-                recommendations_df.loc[index, 'charge_ev'] = True
-                hour_reasons.append(f"Charging EV with excess solar ({net_after_base:.2f}kW available).")
-                actions_taken['ev'] = True
-                net_after_base -= ev_charge_power_kw
-
-            # Sell remaining excess solar if it's significant and price is good
-            # Arbitrary threshold for selling price (e.g., above 10% of max price)
-            max_price = recommendations_df['price_eur_kwh'].max()
-            sell_price_threshold = max_price * 0.1 # Example: only sell if price is > 10% of max observed price
-            if net_after_base > 0.1 and current_price >= sell_price_threshold: # Check if there's significant excess
-                recommendations_df.loc[index, 'sell_to_grid'] = True
-                hour_reasons.append(f"Selling {net_after_base:.2f}kW excess solar at good price ({current_price:.4f} €/kWh).")
-            elif net_after_base > 0.1:
-                hour_reasons.append(f"Excess solar ({net_after_base:.2f}kW) available, but selling price not optimal.")
+    return recommendations_df
+
+def decode_reasons(recommendations_df: pd.DataFrame) -> pd.Series:
+    """
+    Turns the reason codes of the given recommendations into readable explanations,
+    using the user preferences make_smart_decisions stored on the frame.
+    Only call this on the rows that are actually displayed, formatting is comparatively slow.
+    """
+    user_prefs = recommendations_df.attrs['user_prefs']
+    dishwasher_power_kw = user_prefs.dishwasher_power_kw
+    washing_machine_power_kw = user_prefs.washing_machine_power_kw
+    ev_charge_power_kw = user_prefs.ev_charging_power_kw
+
+    reasons = [
+        # The solar surplus after base load is exactly the negated net grid demand
+        _build_reason(code, -net_grid_demand, current_price, dishwasher_power_kw, washing_machine_power_kw, ev_charge_power_kw)
+        for code, net_grid_demand, current_price in zip(
+            recommendations_df['reason_code'].to_numpy(),
+            recommendations_df['net_grid_demand_kw'].to_numpy(),
+            recommendations_df['price_eur_kwh'].to_numpy(),
+        )
+    ]
+    return pd.Series(reasons, index=recommendations_df.index, dtype=object)
+
+def _decide_rules(
+    price, solar_available, hours,
+    working_hours_start, working_hours_end,
+    house_base_consumption_kw, dishwasher_power_kw, washing_machine_power_kw, ev_charge_power_kw,
+    sell_price_threshold, price_quartile_threshold_ev, price_quartile_threshold_appliance,
+):
+    """
+    Decision rules over all hours, written as a single loop so Numba can compile
+    it into one pass that writes every output directly.
+    Returns the charge_ev, run_dishwasher, run_washing_machine and sell_to_grid flags
+    plus the per-hour reason codes.
+    Hours are independent of each other, so the loop can also run in parallel.
+    Without Numba it runs as plain Python, which is cheap for a 48-168 hour forecast.
+    """
+    n = price.shape[0]
+    charge_ev = np.empty(n, dtype=np.bool_)
+    run_dishwasher = np.empty(n, dtype=np.bool_)
+    run_washing_machine = np.empty(n, dtype=np.bool_)
+    sell_to_grid = np.empty(n, dtype=np.bool_)
+    reason_code = np.empty(n, dtype=np.uint8)
+    for i in prange(n):
+        is_working_hours = working_hours_start <= hours[i] < working_hours_end
+        current_price = price[i]
+        code = 0
 
+        # --- Priority 1: Maximize Self-Consumption & Smart Selling ---
+        if solar_available[i] > 0.05: # Small threshold to ignore tiny amounts
+            # Each appliance run on solar "claims" its power before the next one is considered
+            net = solar_available[i] - house_base_consumption_kw
+            if net > dishwasher_power_kw * 0.7:
+                code |= R_DW_SOLAR
+                net -= dishwasher_power_kw
+            if net > washing_machine_power_kw * 0.7:
+                code |= R_WM_SOLAR
+                net -= washing_machine_power_kw
+            if not is_working_hours and net > ev_charge_power_kw * 0.5:
+                code |= R_EV_SOLAR
+                net -= ev_charge_power_kw
+            if net > 0.1:
+                if current_price >= sell_price_threshold:
+                    code |= R_SELL
+                else:
+                    code |= R_EXCESS_UNSOLD
 
         # --- Priority 2: Use Low Grid Price for Appliances/EV (if not using solar) ---
-        # Identify cheapest 25% of hours for grid power
-        price_quartile_threshold_ev = recommendations_df['price_eur_kwh'].quantile(0.25)
-        price_quartile_threshold_appliance = recommendations_df['price_eur_kwh'].quantile(0.15) # Even cheaper for appliances
-
-        # Charge EV if not during working hours AND price is low, AND not already decided to charge with solar
-        if not is_working_hours and current_price <= price_quartile_threshold_ev and not actions_taken.get('ev'):
-            recommendations_df.loc[index, 'charge_ev'] = True
-            hour_reasons.append(f"Charging EV at low grid price ({current_price:.4f} €/kWh).")
-            actions_taken['ev'] = True
-
-        # Run Washing Machine if price is very low and not already decided for solar
-        if current_price <= price_quartile_threshold_appliance and not actions_taken.get('washing_machine'):
-            recommendations_df.loc[index, 'run_washing_machine'] = True
-            hour_reasons.append(f"Running Washing Machine at very low grid price ({current_price:.4f} €/kWh).")
-            actions_taken['washing_machine'] = True
-
-        # Run Dishwasher if price is very low and not already decided for solar
-        if current_price <= price_quartile_threshold_appliance and not actions_taken.get('dishwasher'):
-            recommendations_df.loc[index, 'run_dishwasher'] = True
-            hour_reasons.append(f"Running Dishwasher at very low grid price ({current_price:.4f} €/kWh).")
-            actions_taken['dishwasher'] = True
-
-        # Combine reasons
-        recommendations_df.loc[index, 'reason'] = "; ".join(hour_reasons) if hour_reasons else "No specific action recommended."
-
-    return recommendations_df
\ No newline at end of file
+        if not is_working_hours and current_price <= price_quartile_threshold_ev and not code & R_EV_SOLAR:
+            code |= R_EV_GRID
+        if current_price <= price_quartile_threshold_appliance:
+            if not code & R_WM_SOLAR:
+                code |= R_WM_GRID
+            if not code & R_DW_SOLAR:
+                code |= R_DW_GRID
+
+        charge_ev[i] = (code & (R_EV_SOLAR | R_EV_GRID)) != 0
+        run_dishwasher[i] = (code & (R_DW_SOLAR | R_DW_GRID)) != 0
+        run_washing_machine[i] = (code & (R_WM_SOLAR | R_WM_GRID)) != 0
+        sell_to_grid[i] = (code & R_SELL) != 0
+        reason_code[i] = code
+    return charge_ev, run_dishwasher, run_washing_machine, sell_to_grid, reason_code
+
+# Compiled once and cached on disk so Streamlit reruns skip the JIT cost.
+# The parallel variant is only compiled the first time a long forecast comes in.
+# It must not be disk-cached: both variants share _decide_rules' cache file and
+# Numba's cache key ignores the parallel flag, so it would load the serial code.
+_decide_kernel = njit(cache=True)(_decide_rules) if NUMBA_AVAILABLE else None
+_decide_kernel_parallel = njit(parallel=True)(_decide_rules) if NUMBA_AVAILABLE else None
+
+def _build_reason(
+    code: int,
+    net_after_base: float,
+    current_price: float,
+    dishwasher_power_kw: float,
+    washing_machine_power_kw: float,
+    ev_charge_power_kw: float,
+) -> str:
+    """Builds the human-readable explanation for a single hour's reason code."""
+    hour_reasons = []
+    net = net_after_base
+    if code & R_DW_SOLAR:
+        hour_reasons.append(f"Running Dishwasher with excess solar ({net:.2f}kW available).")
+        net -= dishwasher_power_kw
+    if code & R_WM_SOLAR:
+        hour_reasons.append(f"Running Washing Machine with excess solar ({net:.2f}kW available).")
+        net -= washing_machine_power_kw
+    if code & R_EV_SOLAR:
+        hour_reasons.append(f"Charging EV with excess solar ({net:.2f}kW available).")
+        net -= ev_charge_power_kw
+    if code & R_SELL:
+        hour_reasons.append(f"Selling {net:.2f}kW excess solar at good price ({current_price:.4f} €/kWh).")
+    elif code & R_EXCESS_UNSOLD:
+        hour_reasons.append(f"Excess solar ({net:.2f}kW) available, but selling price not optimal.")
+    if code & R_EV_GRID:
+        hour_reasons.append(f"Charging EV at low grid price ({current_price:.4f} €/kWh).")
+    if code & R_WM_GRID:
+        hour_reasons.append(f"Running Washing Machine at very low grid price ({current_price:.4f} €/kWh).")
+    if code & R_DW_GRID:
+        hour_reasons.append(f"Running Dishwasher at very low grid price ({current_price:.4f} €/kWh).")
+    return "; ".join(hour_reasons) if hour_reasons else "No specific action recommended."